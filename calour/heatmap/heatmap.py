@@ -7,14 +7,15 @@
 # ----------------------------------------------------------------------------
 
 from logging import getLogger
+from functools import lru_cache
 import importlib
-import itertools
 
 import matplotlib as mpl
-import matplotlib.patches as mpatches
+import matplotlib.collections as mcollections
 import numpy as np
+import pandas as pd
 
-from ..transforming import log_n
+from ..transforming import log_n, _log_n
 from ..database import _get_database_class
 
 from ..util import _to_list
@@ -22,6 +23,57 @@ from ..util import _to_list
 logger = getLogger(__name__)
 
 
+def _transitions(items):
+    '''Return the transition indices and the values before each transition.
+
+    Consecutive items are in the same segment if they are equal and of
+    the same type. The comparison is done on integer codes from
+    :func:`pandas.factorize` instead of item by item in python, so
+    consecutive NaNs are in the same segment (NaN is not equal to itself
+    when compared item by item) and the items must be hashable.
+
+    Examples
+    --------
+    >>> idx, values = _transitions(['a', 'a', 'b', 1, 2, None, None])
+    >>> idx.tolist()
+    [2, 3, 4, 5, 7]
+    >>> values.tolist()
+    ['a', 'b', 1, 2, None]
+
+    Parameters
+    ----------
+    items : Iterable of arbitrary hashable objects
+
+    Returns
+    -------
+    tuple of (numpy.ndarray of int, numpy.ndarray)
+        the transition indices (the end of each segment, exclusive) and
+        the value of each segment. For a ``pandas.Series``, the values are
+        the objects the Series holds (e.g. ``Timestamp`` for datetimes)
+    '''
+    if isinstance(items, (np.ndarray, pd.Series)):
+        values = np.asarray(items)
+    else:
+        # keep the original python objects (and their types) in the list
+        values = np.empty(len(items), dtype=object)
+        values[:] = items
+    if len(values) == 0:
+        return np.array([], dtype=int), values
+    codes, _ = pd.factorize(values)
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=False).startswith('mixed'):
+        # also break the segments between equal values of different types (e.g. 1 and 1.0)
+        types, _ = pd.factorize(np.array([str(type(i)) for i in values], dtype=object))
+        codes = np.stack([types, codes])
+    else:
+        codes = codes[np.newaxis, :]
+    changed = (codes[:, 1:] != codes[:, :-1]).any(axis=0)
+    idx = np.append(np.flatnonzero(changed) + 1, len(values))
+    if isinstance(items, pd.Series):
+        # the numpy array has lost the pandas types (e.g. datetime64 instead of Timestamp)
+        return idx, items.iloc[idx - 1].to_numpy(dtype=object)
+    return idx, values[idx - 1]
+
+
 def _transition_index(l):
     '''Return the transition index and current value of the list.
 
@@ -36,22 +88,38 @@ def _transition_index(l):
 
     Parameters
     ----------
-    l : Iterable of arbitrary objects
+    l : Iterable of arbitrary hashable objects
 
     Yields
     ------
     tuple of (int, arbitrary)
         the transition index, the item value
     '''
-    it = enumerate(l)
-    i, item = next(it)
-    item = str(type(item)), item
-    for i, current in it:
-        current = str(type(current)), current
-        if item != current:
-            yield i, item[1]
-            item = current
-    yield i + 1, item[1]
+    idx, values = _transitions(l)
+    yield from zip(idx.tolist(), values.tolist())
+
+
+@lru_cache(maxsize=None)
+def _get_gui_class(gui):
+    '''Get the plot GUI class by its name.
+
+    The lookup is cached, so the module is only imported and searched
+    once when many heatmaps are plotted.
+
+    Parameters
+    ----------
+    gui : str
+        name of the ``PlotGUI`` child class. It should reside in
+        heatmap/lower(classname).py
+
+    Returns
+    -------
+    class
+        the ``PlotGUI`` child class
+    '''
+    gui_module_name = 'calour.heatmap.' + gui.lower()
+    gui_module = importlib.import_module(gui_module_name)
+    return getattr(gui_module, gui)
 
 
 def _create_plot_gui(exp, gui='cli', databases=('dbbact',)):
@@ -84,9 +152,7 @@ def _create_plot_gui(exp, gui='cli', databases=('dbbact',)):
         gui = possible_gui[gui]
     else:
         raise ValueError('Unknown GUI specified: %r. Possible values are: %s' % (gui, list(possible_gui.keys())))
-    gui_module_name = 'calour.heatmap.' + gui.lower()
-    gui_module = importlib.import_module(gui_module_name)
-    GUIClass = getattr(gui_module, gui)
+    GUIClass = _get_gui_class(gui)
     gui_obj = GUIClass(exp)
 
     # link gui with the databases requested
@@ -117,6 +183,10 @@ def heatmap(exp, sample_field=None, feature_field=False, yticklabels_max=100,
     .. note:: By default it log transforms the abundance values and then plot heatmap.
        The original object is not modified.
 
+    .. note:: The values are plotted in single precision (``float32``) to
+       speed up redrawing, so the image array has about 7 significant
+       digits. The mouse hover shows the original abundance values.
+
     .. _heatmap-ref:
 
     Parameters
@@ -157,7 +227,8 @@ def heatmap(exp, sample_field=None, feature_field=False, yticklabels_max=100,
 
     '''
     logger.debug('plot heatmap')
-    # import pyplot is less polite. do it locally
+    # import pyplot is less polite. do it locally. it is only loaded
+    # on the first call; later calls just get it from sys.modules
     import matplotlib.pyplot as plt
     # get the default feature field if not specified (i.e. False)
     if feature_field is False:
@@ -166,6 +237,11 @@ def heatmap(exp, sample_field=None, feature_field=False, yticklabels_max=100,
     # step 1. transform data
     if transform is None:
         data = exp.get_data(sparse=False)
+    elif transform is log_n:
+        # transform only the data, without copying
+        # the whole experiment with its metadata
+        logger.debug('log_n transform the data with param %r' % kwargs)
+        data = _log_n(exp.get_data(sparse=False), **kwargs)
     else:
         logger.debug('transform exp with %r with param %r' % (transform, kwargs))
         data = transform(exp, inplace=False, **kwargs).data
@@ -179,8 +255,11 @@ def heatmap(exp, sample_field=None, feature_field=False, yticklabels_max=100,
     # init the default colormap
     if cmap is None:
         cmap = plt.rcParams['image.cmap']
-    # plot the heatmap
-    ax.imshow(data.transpose(), aspect='auto', interpolation='nearest', cmap=cmap, clim=clim)
+    # plot the heatmap. copy the transposed data into a C-contiguous array
+    # once, so the image resampling on each redraw reads the memory in order.
+    # single precision is enough for display and halves the memory to move
+    display = np.ascontiguousarray(data.T, dtype=np.float32)
+    ax.imshow(display, aspect='auto', interpolation='nearest', cmap=cmap, clim=clim)
     # set the initial zoom window if supplied
     if rect is not None:
         ax.set_xlim((rect[0], rect[1]))
@@ -189,26 +268,30 @@ def heatmap(exp, sample_field=None, feature_field=False, yticklabels_max=100,
     # plot vertical lines between sample groups and add x tick labels
     if sample_field is not None:
         try:
-            xticks = _transition_index(exp.sample_metadata[sample_field])
+            x_pos, x_val = _transitions(exp.sample_metadata[sample_field])
         except KeyError:
             raise ValueError('Sample field %r not in sample metadata' % sample_field)
         ax.set_xlabel(sample_field)
-        x_pos, x_val = zip(*xticks)
-        x_pos = np.array([0.] + list(x_pos))
         # samples position - 0.5 before and go to 0.5 after
-        x_pos -= 0.5
-        for pos in x_pos[1:-1]:
-            ax.axvline(x=pos, color='white')
+        x_pos = np.append(0, x_pos) - 0.5
+        # plot the vertical lines between the sample groups as a single artist.
+        # x is in data coordinates and y in axes coordinates, like ``axvline``
+        if len(x_pos) > 2:
+            segments = np.zeros((len(x_pos) - 2, 2, 2))
+            segments[:, :, 0] = x_pos[1:-1, np.newaxis]
+            segments[:, 1, 1] = 1
+            ax.add_collection(
+                mcollections.LineCollection(segments, colors='white', transform=ax.get_xaxis_transform()),
+                autolim=False)
         # set tick/label at the middle of each sample group
-        ax.set_xticks(x_pos[:-1] + (x_pos[1:] - x_pos[:-1]) / 2)
-        xticklabels = [str(i) for i in x_val]
+        ax.set_xticks((x_pos[:-1] + x_pos[1:]) / 2)
+        xticklabels = pd.Series([str(i) for i in x_val.tolist()])
         # shorten x tick labels that are too long:
         if xticklabel_len is not None:
             mid = int(xticklabel_len / 2)
-            xticklabels = ['%s..%s' % (i[:mid], i[-mid:])
-                           if len(i) > xticklabel_len else i
-                           for i in xticklabels]
-        ax.set_xticklabels(xticklabels, rotation=xticklabel_rot, ha='right')
+            xticklabels = (xticklabels.str[:mid] + '..' + xticklabels.str[-mid:]).where(
+                xticklabels.str.len() > xticklabel_len, xticklabels)
+        ax.set_xticklabels(xticklabels.tolist(), rotation=xticklabel_rot, ha='right')
     else:
         ax.get_xaxis().set_visible(False)
 
@@ -219,11 +302,12 @@ def heatmap(exp, sample_field=None, feature_field=False, yticklabels_max=100,
         except KeyError:
             raise ValueError('Feature field %r not in feature metadata' % feature_field)
         ax.set_ylabel(feature_field)
-        yticklabels = [str(i) for i in ffield]
+        # numpy converts the values to str (including None and nan) without a python loop
+        yticklabels = pd.Series(np.asarray(ffield).astype(str))
         # for each tick label, show 15 characters at most
         if yticklabel_len is not None:
-            yticklabels = [i[-yticklabel_len:] if len(i) > yticklabel_len else i
-                           for i in yticklabels]
+            yticklabels = yticklabels.str[-yticklabel_len:]
+        yticklabels = np.asarray(yticklabels, dtype=object)
 
         def format_fn(tick_val, tick_pos):
             if 0 <= tick_val < numcols:
@@ -244,12 +328,22 @@ def heatmap(exp, sample_field=None, feature_field=False, yticklabels_max=100,
     else:
         ax.get_yaxis().set_visible(False)
 
-    # set the mouse hover string to the value of abundance
+    # set the mouse hover string to the value of abundance.
+    # indexing a single cell of sparse data is slow and format_coord is
+    # called on every mouse move, so densify the hovered rows on demand
+    # and keep the recent ones
+    @lru_cache(maxsize=128)
+    def get_row(row):
+        return exp.data[row].toarray().ravel()
+
     def format_coord(x, y):
         row = int(x + 0.5)
         col = int(y + 0.5)
         if 0 <= col < numcols and 0 <= row < numrows:
-            z = exp.data[row, col]
+            if exp.sparse:
+                z = get_row(row)[col]
+            else:
+                z = exp.data[row, col]
             return 'x=%1.2f, y=%1.2f, z=%1.2f' % (x, y, z)
         else:
             return 'x=%1.2f, y=%1.2f' % (x, y)
@@ -271,7 +365,8 @@ def _ax_color_bar(axes, values, width, position=0, colors=None, axis=0, label=Tr
     position : float, optional
         the position of the color bar (its left bottom corner)
     colors : list of colors, optional
-        the colors for each unique value in the ``values`` list.
+        the colors for each unique value in the ``values`` list,
+        in the order the values first appear.
         if it is ``None``, it will use ``Dark2`` discrete color map
         in a cycling way.
     horizontal : bool, optional
@@ -283,43 +378,41 @@ def _ax_color_bar(axes, values, width, position=0, colors=None, axis=0, label=Tr
     -------
     ``matplotlib`` axes
     '''
-    uniques = np.unique(values)
     if colors is None:
         cmap = mpl.cm.get_cmap('Dark2')
         colors = cmap.colors
-    col = dict(zip(uniques, itertools.cycle(colors)))
-    prev = 0
+    palette = mpl.colors.to_rgba_array(colors)
     offset = 0.5
-    for i, value in _transition_index(values):
-        if value != '':
-            # do not plot the current segment of the bar
-            # if the value is empty
-            if axis == 0:
-                # plot the color bar along x axis
-                pos = prev - offset, position
-                w, h = i - prev, width
-                rotation = 0
-            else:
-                # plot the color bar along y axis
-                pos = position, prev - offset
-                w, h = width, i - prev
-                rotation = 90
-            rect = mpatches.Rectangle(
-                pos,               # position
-                w,                 # width (size along x axis)
-                h,                 # height (size along y axis)
-                edgecolor="none",  # No border
-                facecolor=col[value],
-                label=value)
-            axes.add_patch(rect)
-            if label is True:
-                rx, ry = rect.get_xy()
-                cx = rx + rect.get_width()/2.0
-                cy = ry + rect.get_height()/2.0
-                # add the text in the color bars
-                axes.annotate(value, (cx, cy), color='w', weight='bold',
-                              fontsize=7, ha='center', va='center', rotation=rotation)
-        prev = i
+    idx, vals = _transitions(values)
+    ends = idx - offset
+    starts = np.append(-offset, ends[:-1])
+    # do not plot the segments of the bar with empty value. compare as
+    # objects, as numeric arrays are not compared elementwise with str
+    keep = vals.astype(object) != ''
+    if not keep.any():
+        return axes
+    starts, ends, vals = starts[keep], ends[keep], vals[keep]
+    # cycle the colors over the unique values in the order they appear
+    codes, _ = pd.factorize(vals)
+    rgba = palette[codes % len(palette)]
+    # the corners of all the segments as (x, y) for axis=0 and (y, x) for axis=1
+    verts = np.empty((len(vals), 4, 2))
+    verts[:, :, axis] = np.column_stack([starts, starts, ends, ends])
+    verts[:, :, 1 - axis] = [position, position + width, position + width, position]
+    # plot all the segments of the bar as a single artist
+    bar = mcollections.PolyCollection(
+        verts, facecolors=rgba, edgecolors='none')
+    axes.add_collection(bar)
+    if label is True:
+        rotation = 0 if axis == 0 else 90
+        centers = np.empty((len(vals), 2))
+        centers[:, axis] = (starts + ends) / 2.0
+        centers[:, 1 - axis] = position + width / 2.0
+        # add the text in the color bars. annotation (unlike plain text)
+        # is not drawn when its center is outside of the axes
+        for value, center in zip(vals.tolist(), centers.tolist()):
+            axes.annotate(value, center, color='w', weight='bold',
+                          fontsize=7, ha='center', va='center', rotation=rotation)
     # axes.legend(
     #     handles=[mpatches.Rectangle((0, 0), 0, 0, facecolor=col[k], label=k) for k in col],
     #     bbox_to_anchor=(0, 1.2),
@@ -471,11 +564,11 @@ def plot_sort(exp, fields=None, sample_color_bars=None, feature_color_bars=None,
     PlotGUI
     '''
     if fields is not None:
-        newexp = exp.copy()
-        fields = _to_list(fields)
-        for cfield in fields:
-            newexp.sort_samples(cfield, inplace=True)
-        plot_field = cfield
+        fields = list(_to_list(fields))
+        # sorting by each field in turn (each sort is stable) is the
+        # same as a single sort with the last field as the primary key
+        newexp = exp.sort_samples(fields[::-1])
+        plot_field = fields[-1]
     else:
         newexp = exp
         plot_field = None
@@ -8,13 +8,16 @@
 
 from unittest import main
 import numpy as np
-from numpy.testing import assert_array_almost_equal
+import pandas as pd
+from scipy.sparse import csr_matrix
+from numpy.testing import assert_array_almost_equal, assert_array_equal
 
 from matplotlib import pyplot as plt
 
 import calour as ca
 from calour._testing import Tests
-from calour.heatmap.heatmap import _ax_color_bar, _create_plot_gui
+from calour.transforming import log_n
+from calour.heatmap.heatmap import _ax_color_bar, _create_plot_gui, _transition_index, _transitions
 
 
 class PlotTests(Tests):
@@ -22,6 +25,36 @@ class PlotTests(Tests):
         super().setUp()
         self.test1 = ca.read(self.test2_biom, self.test2_samp, self.test2_feat, normalize=None)
 
+    def test_transition_index(self):
+        # equal values of different types are in different segments
+        self.assertListEqual(list(_transition_index([1, 1.0, True, 1])),
+                             [(1, 1), (2, 1.0), (3, True), (4, 1)])
+        # None and nan are different
+        obs = list(_transition_index(['a', None, None, np.nan]))
+        self.assertListEqual(obs[:2], [(1, 'a'), (3, None)])
+        self.assertEqual(obs[2][0], 4)
+        self.assertTrue(np.isnan(obs[2][1]))
+        self.assertListEqual(list(_transition_index([])), [])
+        # the values of a Series are its own objects
+        dates = pd.Series(['2020-01-01', '2020-01-01', '2020-02-01'], dtype='datetime64[ns]')
+        self.assertListEqual(list(_transition_index(dates)),
+                             [(2, pd.Timestamp('2020-01-01')), (3, pd.Timestamp('2020-02-01'))])
+
+    def test_transitions(self):
+        # consecutive nans are in the same segment
+        idx, values = _transitions(pd.Series([1., np.nan, np.nan, 2.]))
+        assert_array_equal(idx, [1, 3, 4])
+        assert_array_equal(values.astype(float), [1., np.nan, 2.])
+        idx, values = _transitions(np.array([3, 3, 1, 1, 1]))
+        assert_array_equal(idx, [2, 5])
+        assert_array_equal(values, [3, 1])
+        idx, values = _transitions(pd.Series(['2020-01-01', '2020-02-01', '2020-02-01'], dtype='datetime64[ns]'))
+        assert_array_equal(idx, [1, 3])
+        self.assertListEqual(values.tolist(), [pd.Timestamp('2020-01-01'), pd.Timestamp('2020-02-01')])
+        idx, values = _transitions([])
+        self.assertEqual(len(idx), 0)
+        self.assertEqual(len(values), 0)
+
     def test_create_plot_gui(self):
         row, col = 1, 2
         for gui in ('cli', 'qt5', 'jupyter'):
@@ -45,12 +78,13 @@ class PlotTests(Tests):
         # test heatmap is correct
         assert_array_almost_equal(self.test1.get_data(sparse=False).transpose(),
                                   obs_images[0].get_array())
-        obs_lines = ax.lines
+        obs_lines = ax.collections
         # test only one line exists
         self.assertEqual(len(obs_lines), 1)
-        # test the axvline is correct
-        assert_array_almost_equal(obs_lines[0].get_xdata(),
-                                  np.array([6.5, 6.5]))
+        self.assertEqual(len(obs_lines[0].get_segments()), 1)
+        # test the vertical line is correct
+        assert_array_almost_equal(obs_lines[0].get_segments()[0],
+                                  np.array([[6.5, 0], [6.5, 1]]))
         # test axis labels
         self.assertEqual(ax.xaxis.label.get_text(), 'group')
         self.assertEqual(ax.yaxis.label.get_text(), 'ph')
@@ -61,24 +95,106 @@ class PlotTests(Tests):
         self.assertListEqual(obs_yticklabels,
                              self.test1.feature_metadata['ph'].astype(str).tolist())
 
+    def test_heatmap_one_sample_group(self):
+        exp = self.test1.filter_samples('group', 1)
+        ax = exp.heatmap(sample_field='group', feature_field=None).gca()
+        # no line between sample groups
+        self.assertEqual(len(ax.collections), 0)
+        obs_xticklabels = [i.get_text() for i in ax.xaxis.get_ticklabels()]
+        self.assertListEqual(obs_xticklabels, ['1'])
+
+    def test_heatmap_datetime_sample_field(self):
+        exp = self.test1.copy()
+        exp.sample_metadata['date'] = pd.Series(['2020-01-01'] * 7 + ['2020-02-01'] * 2,
+                                                index=exp.sample_metadata.index, dtype='datetime64[ns]')
+        ax = exp.heatmap(sample_field='date', feature_field=None, xticklabel_len=None).gca()
+        obs_xticklabels = [i.get_text() for i in ax.xaxis.get_ticklabels()]
+        self.assertListEqual(obs_xticklabels, ['2020-01-01 00:00:00', '2020-02-01 00:00:00'])
+        assert_array_almost_equal(ax.get_xticks(), [3, 7.5])
+
+    def test_heatmap_log_n(self):
+        dense = self.test1.copy()
+        dense.sparse = False
+        for exp in (self.test1, dense):
+            for kwargs in ({}, {'n': 20}):
+                ax = exp.heatmap(feature_field=None, **kwargs).gca()
+                assert_array_almost_equal(ax.images[0].get_array(),
+                                          log_n(exp, **kwargs).data.transpose(),
+                                          decimal=5)
+        # the original data are not modified
+        assert_array_almost_equal(dense.data, self.test1.get_data(sparse=False))
+
+    def test_heatmap_float32(self):
+        exp = self.test1.normalize(10000)
+        ax = exp.heatmap(transform=None, feature_field=None).gca()
+        # the image is plotted in single precision
+        obs = ax.images[0].get_array()
+        self.assertEqual(obs.dtype, np.float32)
+        assert_array_almost_equal(exp.get_data(sparse=False).transpose(), obs, decimal=3)
+
+    def test_heatmap_format_coord(self):
+        dense = self.test1.copy()
+        dense.sparse = False
+        very_sparse = self.test1.copy()
+        data = np.zeros(very_sparse.shape)
+        data[1, 2] = 5
+        very_sparse.data = csr_matrix(data)
+        # dense data are read directly; sparse data (test1) are densified row by row on hover
+        for exp, z in ((dense, 2), (self.test1, 2), (very_sparse, 5)):
+            ax = exp.heatmap(feature_field=None).gca()
+            self.assertEqual(ax.format_coord(1, 2), 'x=1.00, y=2.00, z=%1.2f' % z)
+            self.assertEqual(ax.format_coord(0.8, 2.3), 'x=0.80, y=2.30, z=%1.2f' % z)
+            self.assertEqual(ax.format_coord(0, 0), 'x=0.00, y=0.00, z=%1.2f' % exp.get_data(sparse=False)[0, 0])
+            self.assertEqual(ax.format_coord(20, 2), 'x=20.00, y=2.00')
+
+    def test_plot_sort(self):
+        fields = ['new.order', 'group']
+        obs = self.test1.plot_sort(fields, gui='cli', databases=[])
+        exp = self.test1
+        for cfield in fields:
+            exp = exp.sort_samples(cfield)
+        self.assertListEqual(obs.exp.sample_metadata.index.tolist(),
+                             exp.sample_metadata.index.tolist())
+        assert_array_almost_equal(obs.exp.get_data(sparse=False), exp.get_data(sparse=False))
+        # the sorting is recorded in the history
+        self.assertIn('sort_samples', obs.exp._call_history[-1])
+        # the samples are labeled by the last field
+        self.assertEqual(obs.axes.xaxis.label.get_text(), 'group')
+        # the original experiment is not modified
+        self.assertListEqual(self.test1.sample_metadata['ori.order'].tolist(), list(range(9)))
+
     def test_ax_color_bar(self):
         fig, ax = plt.subplots()
         colors = [(1.0, 0.0, 0.0, 1), (0.0, 0.5, 0.0, 1)]
         axes = _ax_color_bar(ax, ['a', 'a', 'b'], 0.3, 0, colors)
         self.assertIs(ax, axes)
+        # test all the rectangles are plotted as one collection
+        self.assertEqual(len(axes.collections), 1)
+        bar = axes.collections[0]
         # test face color rectangle in the bar
-        self.assertListEqual(
-            [i.get_facecolor() for i in axes.patches],
-            colors)
+        assert_array_almost_equal(bar.get_facecolor(), colors)
         # test the position rectangle in the bar
-        self.assertListEqual(
-            [i.get_xy() for i in axes.patches],
+        assert_array_almost_equal(
+            [i.vertices[0] for i in bar.get_paths()],
             [(-0.5, 0), (1.5, 0)])
         # test the texts in each rectangle in the bar
         self.assertListEqual(
             [i.get_text() for i in axes.texts],
             ['a', 'b'])
 
+    def test_ax_color_bar_numeric(self):
+        fig, ax = plt.subplots()
+        colors = [(1.0, 0.0, 0.0, 1), (0.0, 0.5, 0.0, 1)]
+        _ax_color_bar(ax, pd.Series([2, 2, 3, 3, 3]), 0.3, 0, colors)
+        bar = ax.collections[0]
+        assert_array_almost_equal(bar.get_facecolor(), colors)
+        assert_array_almost_equal(
+            [i.vertices[0] for i in bar.get_paths()],
+            [(-0.5, 0), (1.5, 0)])
+        self.assertListEqual(
+            [i.get_text() for i in ax.texts],
+            ['2', '3'])
+
 
 if __name__ == '__main__':
     main()
@@ -33,7 +33,7 @@ from scipy import cluster, spatial
 
 from . import Experiment
 from .transforming import log_n, transform, scale
-from .util import _argsort
+from .util import _argsort, _sort_key, _to_list
 
 logger = getLogger(__name__)
 
@@ -175,8 +175,9 @@ def sort_by_metadata(exp, field, axis=0, inplace=False):
 
     Parameters
     ----------
-    field : str
-        Name of the field to sort by
+    field : str or list of str
+        Name of the field to sort by. If it is a list, sort by the first field and
+        break the ties with the next fields in turn
     axis : 0, 1, 's', or 'f'
         sort by samples (0 or 's') or by features (1 or 'f'), i.e. the ``field`` is a column
         in ``sample_metadata`` (0 or 's') or ``feature_metadata`` (1 or 'f')
@@ -195,7 +196,13 @@ def sort_by_metadata(exp, field, axis=0, inplace=False):
         x = exp.feature_metadata
     else:
         raise ValueError('unknown axis %s' % axis)
-    idx = _argsort(x[field].values)
+    fields = _to_list(field)
+    if len(fields) == 1:
+        idx = _argsort(x[fields[0]].values)
+    else:
+        # sort once by all the fields instead of a stable sort for each field
+        keys = [tuple(_sort_key(i) for i in row) for row in zip(*[x[cfield].values for cfield in fields])]
+        idx = sorted(range(len(keys)), key=keys.__getitem__)
     return exp.reorder(idx, axis=axis, inplace=inplace)
 
 
@@ -302,8 +309,9 @@ def sort_samples(exp, field, **kwargs):
 
     Parameters
     ----------
-    field : str
-        The field to sort the samples by
+    field : str or list of str
+        The field(s) to sort the samples by. If it is a list, sort by the
+        first field and break the ties with the next fields in turn
 
     Returns
     -------
@@ -60,6 +60,15 @@ class SortingTests(Tests):
         assert_experiment_equal(obs, exp, almost_equal=True)
         self.assertListEqual(obs.sample_metadata['MF_SAMPLE_NUMBER'].tolist(), list(range(1, 96)))
 
+    def test_sort_samples_multiple_fields(self):
+        obs = self.timeseries.sort_samples(['DAY', 'HOUR', 'MINUTES'])
+        self.assertIsNot(obs, self.timeseries)
+        exp = ca.read(join(self.test_data_dir, 'timeseries.sorted.time.biom'),
+                      join(self.test_data_dir, 'timeseries.sample'),
+                      normalize=None)
+        assert_experiment_equal(obs, exp, almost_equal=True)
+        self.assertListEqual(obs.sample_metadata['MF_SAMPLE_NUMBER'].tolist(), list(range(1, 96)))
+
     def test_sort_by_metadata_feature(self):
         obs = self.test2.sort_by_metadata(
             field='level2', axis=1).sort_by_metadata(
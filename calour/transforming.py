@@ -167,12 +167,32 @@ def log_n(exp, n=1, inplace=False):
     if exp.sparse:
         exp.sparse = False
 
-    exp.data[exp.data < n] = n
-    exp.data = np.log2(exp.data)
+    exp.data = _log_n(exp.data, n=n)
 
     return exp
 
 
+def _log_n(data, n=1):
+    '''Log transform the data array.
+
+    It is the data part of ``log_n`` and can be applied on the data
+    without an ``Experiment``.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        the dense data to transform. It is not modified.
+    n : numeric, optional
+        cap the tiny values and then log transform the data.
+
+    Returns
+    -------
+    numpy.ndarray
+        the log2 transformed data
+    '''
+    return np.log2(np.maximum(data, n))
+
+
 @Experiment._record_sig
 def transform(exp, steps=[], inplace=False, **kwargs):
     '''Chain transformations together.
@@ -349,8 +349,32 @@ def _argsort(values):
         the positions of the sorted values
 
     '''
+    values = [_sort_key(x) for x in values]
+    return sorted(range(len(values)), key=values.__getitem__)
+
+
+def _sort_key(x):
+    '''Get the key to sort a value among values of heterogeneous variable types.
+
+    Examples
+    --------
+    >>> _sort_key(10)
+    ("<class 'float'>", 10.0)
+    >>> _sort_key('a')
+    ("<class 'str'>", 'a')
+
+    Parameters
+    ----------
+    x : any type
+        the value to sort
+
+    Returns
+    -------
+    tuple of (str, arbitrary)
+        the type name and the value. Numbers are all converted to float.
+    '''
     # convert all numbers to float otherwise int will be sorted different place
-    values = [float(x) if isinstance(x, Real) else x for x in values]
+    if isinstance(x, Real):
+        x = float(x)
     # make values ordered by type and sort inside each var type
-    values = [(str(type(x)), x) for x in values]
-    return sorted(range(len(values)), key=values.__getitem__)
+    return str(type(x)), x